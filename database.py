@@ -1,8 +1,91 @@
 import aiosqlite
 import json
 import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from src.config import DATABASE_PATH
+from src.config import DATABASE_PATH, FILTER_BITS, TOKEN_DECIMALS
+
+logger = logging.getLogger(__name__)
+
+# Batching for transaction inserts
+TX_BATCH_SIZE = 200
+TX_FLUSH_INTERVAL = 0.25  # seconds
+
+# Read-only connections used alongside the single writer (WAL allows concurrent readers)
+READER_POOL_SIZE = 4
+
+# SQLite INTEGER is a signed 64-bit value; larger amounts are stored with amount_units NULL
+INT64_MAX = 2**63 - 1
+
+# Backfill expression matching add_transaction: CAST saturates instead of failing, so
+# amounts longer than int64 (compared as equal-length digit strings) become NULL
+AMOUNT_UNITS_SQL = """
+    CASE WHEN length(amount) < 19 OR (length(amount) = 19 AND amount <= '9223372036854775807')
+    THEN CAST(amount AS INTEGER) END
+"""
+
+# Shared by the batched insert and its per-row fallback
+INSERT_TRANSACTION_SQL = """
+    INSERT OR IGNORE INTO transactions 
+    (hash, type, amount, token, from_addr, to_addr, eth_addr, timestamp, block_height,
+     ts_epoch, amount_units)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+async def configure_connection(db):
+    """Apply performance PRAGMAs to a freshly opened connection."""
+    # WAL lets readers proceed while a write is in progress and halves fsyncs per commit
+    if not DATABASE_PATH.endswith(':memory:'):
+        await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute("PRAGMA temp_store=MEMORY")
+    await db.execute("PRAGMA cache_size=-64000")
+    await db.execute("PRAGMA busy_timeout=5000")
+    # Read pages through mmap instead of read() syscalls (256 MiB)
+    await db.execute("PRAGMA mmap_size=268435456")
+
+async def add_column_if_missing(db, table, column, definition):
+    """Add a column to an existing table. Returns True if it was added."""
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        columns = [row[1] for row in await cursor.fetchall()]
+    if column in columns:
+        return False
+    await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+def filters_to_mask(filters):
+    """Convert a list of transaction type names to a filter bitmask."""
+    mask = 0
+    for name in filters:
+        mask |= FILTER_BITS.get(name, 0)
+    return mask
+
+async def backfill_filter_mask(db):
+    """Populate filter_mask from the legacy JSON filters column."""
+    updates = []
+    async with db.execute(
+        "SELECT user_id, filters FROM subscribers WHERE filters IS NOT NULL AND filters != '[]'"
+    ) as cursor:
+        rows = await cursor.fetchall()
+    
+    for row in rows:
+        try:
+            user_filters = json.loads(row[1])
+        except json.JSONDecodeError:
+            continue
+        # Invalid filter names have no bit and are dropped here
+        mask = filters_to_mask(user_filters)
+        if mask:
+            updates.append((mask, row[0]))
+    
+    if updates:
+        await db.executemany(
+            "UPDATE subscribers SET filter_mask = ? WHERE user_id = ?",
+            updates
+        )
+        print(f"Converted filters to bitmask for {len(updates)} users")
 
 async def init_database():
     """Initialize the SQLite database with required tables."""
@@ -11,6 +94,8 @@ async def init_database():
     db_path.parent.mkdir(parents=True, exist_ok=True)
     
     async with aiosqlite.connect(DATABASE_PATH) as db:
+        await configure_connection(db)
+        
         # Create subscribers table
         await db.execute("""
             CREATE TABLE IF NOT EXISTS subscribers (
@@ -18,10 +103,15 @@ async def init_database():
                 username TEXT,
                 active BOOLEAN DEFAULT 1,
                 filters TEXT DEFAULT '[]',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                filter_mask INTEGER DEFAULT 0
             )
         """)
         
+        # Filters moved from a JSON list to a bitmask; the JSON column is kept for one release
+        if await add_column_if_missing(db, 'subscribers', 'filter_mask', 'INTEGER DEFAULT 0'):
+            await backfill_filter_mask(db)
+        
         # Create transactions table
         await db.execute("""
             CREATE TABLE IF NOT EXISTS transactions (
@@ -33,10 +123,28 @@ async def init_database():
                 to_addr TEXT,
                 eth_addr TEXT,
                 timestamp TIMESTAMP,
-                block_height INTEGER
+                block_height INTEGER,
+                ts_epoch INTEGER,
+                amount_units INTEGER
             )
         """)
         
+        # Databases created before ts_epoch existed need the column and a backfill.
+        # Stored timestamps are naive local time, so convert them with 'utc' to match
+        # the int(timestamp.timestamp()) written for new rows
+        if await add_column_if_missing(db, 'transactions', 'ts_epoch', 'INTEGER'):
+            await db.execute("""
+                UPDATE transactions SET ts_epoch = CAST(strftime('%s', timestamp, 'utc') AS INTEGER)
+                WHERE timestamp IS NOT NULL
+            """)
+        
+        # Integer minor units let the statistics query SUM without parsing TEXT
+        if await add_column_if_missing(db, 'transactions', 'amount_units', 'INTEGER'):
+            await db.execute(f"""
+                UPDATE transactions SET amount_units = {AMOUNT_UNITS_SQL}
+                WHERE amount IS NOT NULL AND amount != ''
+            """)
+        
         # Create statistics table
         await db.execute("""
             CREATE TABLE IF NOT EXISTS statistics (
@@ -46,135 +154,276 @@ async def init_database():
             )
         """)
         
+        # Create indexes for the statistics and subscriber queries; amount_units makes
+        # idx_tx_epoch_type_token covering, so the statistics SUM never reads the table
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tx_epoch_type_token
+            ON transactions(ts_epoch, type, token, amount_units)
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sub_active
+            ON subscribers(active) WHERE active = 1
+        """)
+        
         await db.commit()
         print(f"Database initialized at {DATABASE_PATH}")
 
 class Database:
     def __init__(self):
         self.path = DATABASE_PATH
+        self.db = None  # writer connection
+        self._readers = asyncio.Queue()
+        self._reader_conns = []  # every reader, including ones borrowed from the pool
+        self._write_lock = asyncio.Lock()
+        self._tx_queue = asyncio.Queue()
+        self._flusher = None
+        self._subs_cache = {}
+        # Inverted index of transaction type -> user_ids that want it
+        self._by_type = {tx_type: set() for tx_type in FILTER_BITS}
+        self._unfiltered = set()  # users with no filter (mask 0) also get unknown types
+    
+    async def connect(self):
+        """Open the writer connection and the pool of reader connections."""
+        self.db = await aiosqlite.connect(self.path)
+        await configure_connection(self.db)
+        for _ in range(READER_POOL_SIZE):
+            reader = await aiosqlite.connect(self.path)
+            await configure_connection(reader)
+            # Readers only serve SELECTs; refuse writes so they never take the write lock
+            await reader.execute("PRAGMA query_only=ON")
+            self._reader_conns.append(reader)
+            self._readers.put_nowait(reader)
+        await self._load_subs()
+        self._flusher = asyncio.create_task(self._flush_loop())
+    
+    async def close(self):
+        """Flush pending transactions and close all database connections."""
+        if self._flusher:
+            await self._tx_queue.put(None)
+            await self._flusher
+            self._flusher = None
+        # Close every reader, not just the idle ones: a reader still borrowed by an in-flight
+        # query would otherwise keep its aiosqlite thread (and the process) alive
+        for reader in self._reader_conns:
+            await reader.close()
+        self._reader_conns = []
+        self._readers = asyncio.Queue()
+        if self.db:
+            # Refresh planner statistics for the indexes before closing
+            await self.db.execute("PRAGMA optimize")
+            await self.db.close()
+            self.db = None
+    
+    def _index_subscriber(self, user_id, filter_mask):
+        """Add a subscriber to the type index according to their filter bitmask."""
+        self._unindex_subscriber(user_id)
+        if not filter_mask:
+            self._unfiltered.add(user_id)
+        for tx_type, bit in FILTER_BITS.items():
+            if not filter_mask or filter_mask & bit:
+                self._by_type[tx_type].add(user_id)
+    
+    def _unindex_subscriber(self, user_id):
+        """Remove a subscriber from the type index."""
+        self._unfiltered.discard(user_id)
+        for user_ids in self._by_type.values():
+            user_ids.discard(user_id)
+    
+    @asynccontextmanager
+    async def _reader(self):
+        """Borrow a reader connection from the pool for SELECT queries."""
+        reader = await self._readers.get()
+        try:
+            yield reader
+        finally:
+            self._readers.put_nowait(reader)
     
     async def add_subscriber(self, user_id, username=None):
         """Add a new subscriber to the database."""
-        async with aiosqlite.connect(self.path) as db:
-            await db.execute(
+        async with self._write_lock:
+            await self.db.execute(
                 "INSERT OR REPLACE INTO subscribers (user_id, username, active) VALUES (?, ?, 1)",
                 (user_id, username)
             )
-            await db.commit()
+            await self.db.commit()
+        # INSERT OR REPLACE resets filters to the column default
+        self._subs_cache[user_id] = {
+            'user_id': user_id,
+            'username': username,
+            'filter_mask': 0
+        }
+        self._index_subscriber(user_id, 0)
     
     async def remove_subscriber(self, user_id):
         """Mark a subscriber as inactive."""
-        async with aiosqlite.connect(self.path) as db:
-            await db.execute(
+        async with self._write_lock:
+            await self.db.execute(
                 "UPDATE subscribers SET active = 0 WHERE user_id = ?",
                 (user_id,)
             )
-            await db.commit()
+            await self.db.commit()
+        self._subs_cache.pop(user_id, None)
+        self._unindex_subscriber(user_id)
+    
+    async def _load_subs(self):
+        """Load active subscribers into the in-memory cache."""
+        self._subs_cache = {}
+        self._unfiltered = set()
+        for user_ids in self._by_type.values():
+            user_ids.clear()
+        async with self._reader() as reader, reader.execute(
+            "SELECT user_id, username, filter_mask FROM subscribers WHERE active = 1"
+        ) as cursor:
+            rows = await cursor.fetchall()
+        
+        for row in rows:
+            self._subs_cache[row[0]] = {
+                'user_id': row[0],
+                'username': row[1],
+                'filter_mask': row[2] or 0
+            }
+            self._index_subscriber(row[0], row[2] or 0)
     
     async def get_active_subscribers(self):
         """Get all active subscribers."""
-        async with aiosqlite.connect(self.path) as db:
-            async with db.execute(
-                "SELECT user_id, username, filters FROM subscribers WHERE active = 1"
-            ) as cursor:
-                subscribers = []
-                async for row in cursor:
-                    user_filters = json.loads(row[2]) if row[2] else []
-                    
-                    # Clean up any invalid filters (safety check)
-                    valid_filters = ['WrapToken', 'UnwrapToken', 'Redeem']
-                    cleaned_filters = [f for f in user_filters if f in valid_filters]
-                    
-                    # If filters were cleaned, update the database
-                    if len(cleaned_filters) != len(user_filters):
-                        await db.execute(
-                            "UPDATE subscribers SET filters = ? WHERE user_id = ?",
-                            (json.dumps(cleaned_filters), row[0])
-                        )
-                        await db.commit()
-                        print(f"Cleaned invalid filters for user {row[0]}")
-                    
-                    subscribers.append({
-                        'user_id': row[0],
-                        'username': row[1],
-                        'filters': cleaned_filters
-                    })
-                return subscribers
-    
-    async def update_subscriber_filters(self, user_id, filters):
-        """Update subscriber's transaction type filters."""
-        async with aiosqlite.connect(self.path) as db:
-            await db.execute(
-                "UPDATE subscribers SET filters = ? WHERE user_id = ?",
-                (json.dumps(filters), user_id)
+        return list(self._subs_cache.values())
+    
+    def get_subscribers_for_type(self, tx_type):
+        """Get the user_ids of active subscribers whose filters match a transaction type."""
+        return list(self._by_type.get(tx_type, self._unfiltered))
+    
+    async def update_subscriber_filters(self, user_id, filter_mask):
+        """Update subscriber's transaction type filter bitmask (0 means all types)."""
+        async with self._write_lock:
+            await self.db.execute(
+                "UPDATE subscribers SET filter_mask = ? WHERE user_id = ?",
+                (filter_mask, user_id)
             )
-            await db.commit()
+            await self.db.commit()
+        if user_id in self._subs_cache:
+            self._subs_cache[user_id]['filter_mask'] = filter_mask
+            self._index_subscriber(user_id, filter_mask)
     
     async def add_transaction(self, tx_data):
-        """Add a transaction to the database."""
-        async with aiosqlite.connect(self.path) as db:
-            # Convert datetime to string if present
-            timestamp = tx_data.get('timestamp')
-            if timestamp and hasattr(timestamp, 'isoformat'):
-                timestamp = timestamp.isoformat()
+        """Queue a transaction for the background batch writer."""
+        # Convert datetime to string and unix seconds if present
+        timestamp = tx_data.get('timestamp')
+        ts_epoch = None
+        if timestamp and hasattr(timestamp, 'isoformat'):
+            ts_epoch = int(timestamp.timestamp())
+            timestamp = timestamp.isoformat()
+        
+        # Amounts arrive as integer strings of the token's smallest unit
+        amount = tx_data.get('amount')
+        try:
+            amount_units = int(amount)
+        except (TypeError, ValueError):
+            amount_units = None
+        # Anyone can send a high-supply token to the bridge; don't let it overflow the column
+        if amount_units is not None and not -INT64_MAX - 1 <= amount_units <= INT64_MAX:
+            amount_units = None
+        
+        await self._tx_queue.put((
+            tx_data.get('hash'),
+            tx_data.get('type'),
+            amount,
+            tx_data.get('token'),
+            tx_data.get('from_addr'),
+            tx_data.get('to_addr'),
+            tx_data.get('eth_addr'),
+            timestamp,
+            tx_data.get('block_height'),
+            ts_epoch,
+            amount_units
+        ))
+    
+    async def _flush_loop(self):
+        """Drain queued transactions and write them in batches."""
+        loop = asyncio.get_running_loop()
+        while True:
+            row = await self._tx_queue.get()
+            if row is None:
+                return
+            
+            # Collect more rows until the batch is full or the flush interval passes
+            rows = [row]
+            stopping = False
+            deadline = loop.time() + TX_FLUSH_INTERVAL
+            while len(rows) < TX_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._tx_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                rows.append(row)
             
+            await self._write_transactions(rows)
+            if stopping:
+                return
+    
+    async def _write_transactions(self, rows):
+        """Insert a batch of transaction rows inside a single transaction."""
+        async with self._write_lock:
             try:
-                await db.execute("""
-                    INSERT OR IGNORE INTO transactions 
-                    (hash, type, amount, token, from_addr, to_addr, eth_addr, timestamp, block_height)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    tx_data.get('hash'),
-                    tx_data.get('type'),
-                    tx_data.get('amount'),
-                    tx_data.get('token'),
-                    tx_data.get('from_addr'),
-                    tx_data.get('to_addr'),
-                    tx_data.get('eth_addr'),
-                    timestamp,
-                    tx_data.get('block_height')
-                ))
-                await db.commit()
-                print(f"Transaction saved: {tx_data.get('type')} - {tx_data.get('hash', '')[:16]}...")
+                await self.db.executemany(INSERT_TRANSACTION_SQL, rows)
+                await self.db.commit()
+                logger.debug("Transactions saved: %d", len(rows))
+                return
             except Exception as e:
-                print(f"Error saving transaction: {e}")
-                print(f"Transaction data: {tx_data}")
+                # Discard the partial batch so a later commit on the writer can't persist it
+                await self.db.rollback()
+                logger.error("Error saving %d transactions, retrying one by one: %s", len(rows), e)
+            
+            # Fall back to per-row inserts so one bad row only costs itself
+            for row in rows:
+                try:
+                    await self.db.execute(INSERT_TRANSACTION_SQL, row)
+                    await self.db.commit()
+                except Exception as e:
+                    await self.db.rollback()
+                    logger.error("Error saving transaction %s: %s", row[0], e)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Transaction row: %s", row)
     
     async def get_statistics(self, period_days=1):
         """Get transaction statistics for a given period."""
-        async with aiosqlite.connect(self.path) as db:
-            # First, let's check if we have any transactions at all
-            async with db.execute("SELECT COUNT(*) FROM transactions") as cursor:
-                total = await cursor.fetchone()
-                print(f"Total transactions in database: {total[0]}")
-            
-            query = """
-                SELECT 
-                    type, 
-                    COUNT(*) as count, 
-                    token,
-                    SUM(CAST(amount AS REAL)) as volume
-                FROM transactions 
-                WHERE timestamp IS NULL OR timestamp > datetime('now', '-{} days')
-                GROUP BY type, token
-            """.format(period_days)
-            
-            async with db.execute(query) as cursor:
-                stats = []
-                async for row in cursor:
-                    stats.append({
-                        'type': row[0],
-                        'count': row[1],
-                        'token': row[2],
-                        'volume': row[3]
-                    })
-                
-                if not stats:
-                    print(f"No stats found for period: {period_days} days")
-                else:
-                    print(f"Found {len(stats)} stat entries")
-                    
-                return stats
+        # TOTAL() sums as a float, so a window's volume can't overflow int64 like SUM() can
+        query = """
+            SELECT 
+                type, 
+                COUNT(*) as count, 
+                token,
+                TOTAL(amount_units) as volume
+            FROM transactions 
+            WHERE ts_epoch IS NULL OR ts_epoch > ?
+            GROUP BY type, token
+        """
+        cutoff = int(time.time()) - period_days * 86400
+        
+        async with self._reader() as reader, reader.execute(query, (cutoff,)) as cursor:
+            rows = await cursor.fetchall()
+        
+        stats = []
+        for row in rows:
+            # Convert summed minor units to whole tokens for display
+            volume = row[3]
+            if volume is not None:
+                volume = volume / 10 ** TOKEN_DECIMALS.get(row[2], 8)
+            stats.append({
+                'type': row[0],
+                'count': row[1],
+                'token': row[2],
+                'volume': volume
+            })
+        
+        logger.debug("Found %d stat entries for period: %d days", len(stats), period_days)
+        
+        return stats
 
 if __name__ == "__main__":
     # Initialize database when script is run directly
@@ -10,6 +10,13 @@ else
     echo "LOG_LEVEL=DEBUG" >> .env
 fi
 
+# Raw WebSocket frames are only written when LOG_RAW_MESSAGES is also set
+if grep -q "LOG_RAW_MESSAGES" .env; then
+    sed -i.bak 's/LOG_RAW_MESSAGES=.*/LOG_RAW_MESSAGES=1/' .env
+else
+    echo "LOG_RAW_MESSAGES=1" >> .env
+fi
+
 echo "✅ Debug mode enabled!"
 echo "Now restart the bot to see detailed logs:"
 echo ""
@@ -23,5 +30,7 @@ echo "  python3 -m src.bot"
 echo ""
 echo "Logs will be saved to:"
 echo "  logs/bot.log - General bot logs"
-echo "  logs/ws_*.json - Raw WebSocket messages"
-echo "  logs/tx_*.json - Decoded transactions"
\ No newline at end of file
+echo "  logs/ws_YYYYMMDDHH.ndjson - Hourly debug dumps, one JSON record per line:"
+echo "    kind=ws_raw - Raw WebSocket messages"
+echo "    kind=tx_to_bridge / tx_from_bridge - Decoded transactions"
+echo "    kind=ws_error - Processing errors with the recent raw messages"
\ No newline at end of file
@@ -5,19 +5,27 @@ Database migration script for Bridge Bot v2.0
 This script:
 1. Ensures all required tables exist 
 2. Cleans up invalid filters from existing users
-3. Safely migrates production database without losing user data
+3. Converts subscriber filters to the filter_mask bitmask column
+4. Safely migrates production database without losing user data
 """
 
-import asyncio
-import aiosqlite
 import json
 import os
+import sqlite3
+from contextlib import closing
 from pathlib import Path
 
 # Get database path from environment or use default
 DATABASE_PATH = os.getenv('DATABASE_PATH', './data/bridge_bot.db')
 
-async def migrate_database():
+# Bitmask values for subscriber filters (mirrors FILTER_BITS in src/config.py)
+FILTER_BITS = {
+    'WrapToken': 1,
+    'UnwrapToken': 2,
+    'Redeem': 4
+}
+
+def migrate_database():
     """Migrate the database schema and clean up invalid data."""
     
     print("🚀 Starting Bridge Bot Database Migration")
@@ -27,32 +35,61 @@ async def migrate_database():
     data_dir = Path(DATABASE_PATH).parent
     data_dir.mkdir(exist_ok=True)
     
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    # One-shot script: plain sqlite3 avoids aiosqlite's per-call thread hop
+    with closing(sqlite3.connect(DATABASE_PATH)) as db:
+        
+        # Switch production databases to WAL, matching the bot's connections
+        db.execute("PRAGMA journal_mode=WAL")
         
         # 1. Check current schema
         print("📋 Checking current database schema...")
         
         # Check if tables exist
-        async with db.execute("SELECT name FROM sqlite_master WHERE type='table'") as cursor:
-            tables = [row[0] async for row in cursor]
-            print(f"   Found tables: {', '.join(tables) if tables else 'None'}")
+        tables = [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        print(f"   Found tables: {', '.join(tables) if tables else 'None'}")
         
         # 2. Create missing tables (this is safe - CREATE TABLE IF NOT EXISTS)
         print("\n🔧 Ensuring all required tables exist...")
         
         # Create subscribers table
-        await db.execute("""
+        db.execute("""
             CREATE TABLE IF NOT EXISTS subscribers (
                 user_id INTEGER PRIMARY KEY,
                 username TEXT,
                 active BOOLEAN DEFAULT 1,
                 filters TEXT DEFAULT '[]',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                filter_mask INTEGER DEFAULT 0
             )
         """)
         
+        # Add the filter bitmask column that replaces the JSON filters list
+        sub_columns = [row[1] for row in db.execute("PRAGMA table_info(subscribers)")]
+        if 'filter_mask' not in sub_columns:
+            print("   ➕ Adding filter_mask column to subscribers")
+            db.execute("ALTER TABLE subscribers ADD COLUMN filter_mask INTEGER DEFAULT 0")
+            
+            mask_updates = []
+            for user_id, filters_json in db.execute(
+                "SELECT user_id, filters FROM subscribers WHERE filters IS NOT NULL AND filters != '[]'"
+            ):
+                try:
+                    mask = 0
+                    for f in json.loads(filters_json):
+                        mask |= FILTER_BITS.get(f, 0)
+                except json.JSONDecodeError:
+                    continue
+                if mask:
+                    mask_updates.append((mask, user_id))
+            
+            db.executemany(
+                "UPDATE subscribers SET filter_mask = ? WHERE user_id = ?",
+                mask_updates
+            )
+            print(f"   ✅ Converted filters to bitmask for {len(mask_updates)} users")
+        
         # Create transactions table
-        await db.execute("""
+        db.execute("""
             CREATE TABLE IF NOT EXISTS transactions (
                 hash TEXT PRIMARY KEY,
                 type TEXT NOT NULL,
@@ -62,12 +99,37 @@ async def migrate_database():
                 to_addr TEXT,
                 eth_addr TEXT,
                 timestamp TIMESTAMP,
-                block_height INTEGER
+                block_height INTEGER,
+                ts_epoch INTEGER,
+                amount_units INTEGER
             )
         """)
         
+        # Add the unix-seconds timestamp column used by the statistics query
+        tx_columns = [row[1] for row in db.execute("PRAGMA table_info(transactions)")]
+        if 'ts_epoch' not in tx_columns:
+            print("   ➕ Adding ts_epoch column to transactions")
+            db.execute("ALTER TABLE transactions ADD COLUMN ts_epoch INTEGER")
+        # Timestamps are stored as naive local time; 'utc' converts them like the bot does
+        db.execute("""
+            UPDATE transactions SET ts_epoch = CAST(strftime('%s', timestamp, 'utc') AS INTEGER)
+            WHERE ts_epoch IS NULL AND timestamp IS NOT NULL
+        """)
+        
+        # Add the integer minor-units amount column summed by the statistics query
+        if 'amount_units' not in tx_columns:
+            print("   ➕ Adding amount_units column to transactions")
+            db.execute("ALTER TABLE transactions ADD COLUMN amount_units INTEGER")
+        # Amounts beyond int64 stay NULL (mirrors AMOUNT_UNITS_SQL in database.py; CAST would saturate)
+        db.execute("""
+            UPDATE transactions SET amount_units =
+                CASE WHEN length(amount) < 19 OR (length(amount) = 19 AND amount <= '9223372036854775807')
+                THEN CAST(amount AS INTEGER) END
+            WHERE amount_units IS NULL AND amount IS NOT NULL AND amount != ''
+        """)
+        
         # Create statistics table
-        await db.execute("""
+        db.execute("""
             CREATE TABLE IF NOT EXISTS statistics (
                 date DATE PRIMARY KEY,
                 tx_count INTEGER DEFAULT 0,
@@ -75,15 +137,25 @@ async def migrate_database():
             )
         """)
         
-        await db.commit()
-        print("   ✅ All tables created/verified")
+        # Create indexes for the statistics and subscriber queries; amount_units makes
+        # idx_tx_epoch_type_token covering, so the statistics SUM never reads the table
+        db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tx_epoch_type_token
+            ON transactions(ts_epoch, type, token, amount_units)
+        """)
+        db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sub_active
+            ON subscribers(active) WHERE active = 1
+        """)
+        
+        db.commit()
+        print("   ✅ All tables and indexes created/verified")
         
         # 3. Check current users and their filters
         print("\n👥 Analyzing existing users and filters...")
         
-        async with db.execute("SELECT COUNT(*) FROM subscribers") as cursor:
-            total_users = (await cursor.fetchone())[0]
-            
+        total_users = db.execute("SELECT COUNT(*) FROM subscribers").fetchone()[0]
+        
         print(f"   Total users: {total_users}")
         
         users_updated = 0  # Initialize here to avoid scope issues
@@ -100,38 +172,35 @@ async def migrate_database():
             # Old filters that are no longer supported
             OLD_FILTERS = ['Transfer', 'UpdateWrapRequest']
             
-            async with db.execute("SELECT user_id, username, filters FROM subscribers WHERE active = 1") as cursor:
-                async for row in cursor:
-                    user_id, username, filters_json = row
-                    
-                    if filters_json:
-                        try:
-                            current_filters = json.loads(filters_json)
-                            
-                            # Clean filters - remove invalid ones
-                            new_filters = [f for f in current_filters if f in VALID_FILTERS]
-                            
-                            # Check if we removed any filters
-                            removed_filters = [f for f in current_filters if f not in VALID_FILTERS]
-                            
-                            if removed_filters:
-                                print(f"   👤 User {user_id} ({username}): Removing invalid filters: {removed_filters}")
-                                
-                                # Update user's filters
-                                await db.execute(
-                                    "UPDATE subscribers SET filters = ? WHERE user_id = ?",
-                                    (json.dumps(new_filters), user_id)
-                                )
-                                users_updated += 1
-                        except json.JSONDecodeError:
-                            print(f"   ⚠️  User {user_id} has invalid filter JSON, clearing...")
-                            await db.execute(
-                                "UPDATE subscribers SET filters = '[]' WHERE user_id = ?",
-                                (user_id,)
-                            )
-                            users_updated += 1
+            filter_updates = []
+            for user_id, username, filters_json in db.execute(
+                "SELECT user_id, username, filters FROM subscribers WHERE active = 1"
+            ):
+                # Nothing to clean for the common default, so skip the JSON parse
+                if filters_json and filters_json != '[]':
+                    try:
+                        current_filters = json.loads(filters_json)
+                        
+                        # Clean filters - remove invalid ones
+                        new_filters = [f for f in current_filters if f in VALID_FILTERS]
+                        
+                        # Check if we removed any filters
+                        removed_filters = [f for f in current_filters if f not in VALID_FILTERS]
+                        
+                        if removed_filters:
+                            print(f"   👤 User {user_id} ({username}): Removing invalid filters: {removed_filters}")
+                            filter_updates.append((json.dumps(new_filters), user_id))
+                    except json.JSONDecodeError:
+                        print(f"   ⚠️  User {user_id} has invalid filter JSON, clearing...")
+                        filter_updates.append(('[]', user_id))
             
-            await db.commit()
+            # Apply all filter updates in one statement
+            db.executemany(
+                "UPDATE subscribers SET filters = ? WHERE user_id = ?",
+                filter_updates
+            )
+            db.commit()
+            users_updated = len(filter_updates)
             
             if users_updated > 0:
                 print(f"   ✅ Updated filters for {users_updated} users")
@@ -141,18 +210,21 @@ async def migrate_database():
         # 5. Check existing transactions
         print("\n📊 Checking transaction data...")
         
-        async with db.execute("SELECT COUNT(*) FROM transactions") as cursor:
-            total_txs = (await cursor.fetchone())[0]
-            
+        # One scan gives the per-type breakdown; the total is its sum
+        tx_types = dict(db.execute("SELECT type, COUNT(*) FROM transactions GROUP BY type"))
+        total_txs = sum(tx_types.values())
+        
         print(f"   Total transactions: {total_txs}")
         
         if total_txs > 0:
             # Show transaction type breakdown
-            async with db.execute("SELECT type, COUNT(*) FROM transactions GROUP BY type") as cursor:
-                tx_types = {row[0]: row[1] async for row in cursor}
-                print("   Transaction types:")
-                for tx_type, count in tx_types.items():
-                    print(f"     - {tx_type}: {count}")
+            print("   Transaction types:")
+            for tx_type, count in tx_types.items():
+                print(f"     - {tx_type}: {count}")
+        
+        # Refresh query planner statistics so the new indexes are used
+        db.execute("ANALYZE")
+        db.commit()
         
         print("\n🎉 Migration completed successfully!")
         print("=" * 60)
@@ -165,42 +237,42 @@ async def migrate_database():
         
         return total_users, users_updated, total_txs
 
-async def verify_migration():
+def verify_migration():
     """Verify the migration was successful."""
     print("\n🔍 Verifying migration...")
     
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Check that all users have valid filters only
-        async with db.execute("""
-            SELECT user_id, username, filters 
+    # The bot reads filter_mask; the legacy JSON filters column is no longer kept in sync
+    valid_bits = 0
+    for bit in FILTER_BITS.values():
+        valid_bits |= bit
+    
+    with closing(sqlite3.connect(DATABASE_PATH)) as db:
+        # Check that all users have valid filter bits only
+        rows = db.execute("""
+            SELECT user_id, username, filter_mask 
             FROM subscribers 
-            WHERE active = 1 AND filters != '[]'
-        """) as cursor:
-            
-            invalid_found = False
-            VALID_FILTERS = ['WrapToken', 'UnwrapToken', 'Redeem']
-            
-            async for row in cursor:
-                user_id, username, filters_json = row
-                filters = json.loads(filters_json)
-                
-                invalid_filters = [f for f in filters if f not in VALID_FILTERS]
-                if invalid_filters:
-                    print(f"   ❌ User {user_id} still has invalid filters: {invalid_filters}")
-                    invalid_found = True
-            
-            if not invalid_found:
-                print("   ✅ All user filters are valid")
-                return True
-            else:
-                print("   ❌ Some users still have invalid filters")
-                return False
+            WHERE active = 1 AND filter_mask != 0
+        """)
+        
+        invalid_found = False
+        
+        for user_id, username, filter_mask in rows:
+            if filter_mask & ~valid_bits:
+                print(f"   ❌ User {user_id} has invalid filter bits: {filter_mask:#x}")
+                invalid_found = True
+        
+        if not invalid_found:
+            print("   ✅ All user filters are valid")
+            return True
+        else:
+            print("   ❌ Some users still have invalid filters")
+            return False
 
 if __name__ == "__main__":
-    async def run_migration():
+    def run_migration():
         try:
-            total_users, users_updated, total_txs = await migrate_database()
-            success = await verify_migration()
+            total_users, users_updated, total_txs = migrate_database()
+            success = verify_migration()
             
             if success:
                 print("\n🎉 Migration completed successfully!")
@@ -215,5 +287,5 @@ if __name__ == "__main__":
             traceback.print_exc()
             return False
     
-    success = asyncio.run(run_migration())
+    success = run_migration()
     exit(0 if success else 1)
\ No newline at end of file
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import signal
 import sys
 from pathlib import Path
 
@@ -18,6 +19,11 @@ LOGS_DIR.mkdir(exist_ok=True)
 
 # Configure logging with file handler
 log_level = getattr(logging, LOG_LEVEL.upper()) if LOG_LEVEL else logging.INFO
+
+# The log format doesn't use thread or process info, so skip collecting it per record
+logging.logThreads = False
+logging.logProcesses = False
+
 logging.basicConfig(
     level=log_level,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -42,10 +48,12 @@ class ZenonBridgeBot:
         self.handlers = TelegramHandlers()
         self.websocket = None
         self.running = False
+        self._stopped = False
+        self._stop_event = asyncio.Event()
     
     async def on_transaction(self, tx_info):
         """Callback for new transactions from WebSocket."""
-        logger.info(f"New transaction: {tx_info['type']} - {tx_info['hash']}")
+        logger.info("New transaction: %s - %s", tx_info['type'], tx_info['hash'])
         await self.handlers.send_transaction_notification(self.application, tx_info)
     
     async def initialize(self):
@@ -56,6 +64,7 @@ class ZenonBridgeBot:
         
         # Initialize database
         await init_database()
+        await self.handlers.db.connect()
         
         # Create Telegram application
         self.application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
@@ -87,10 +96,18 @@ class ZenonBridgeBot:
         # Start WebSocket connection in background
         websocket_task = asyncio.create_task(self.websocket.start())
         
+        # Wake up immediately on SIGINT/SIGTERM (not available on Windows)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop_event.set)
+            except NotImplementedError:
+                pass
+        
         try:
-            # Keep bot running
-            while self.running:
-                await asyncio.sleep(1)
+            # Keep bot running until stop() or a signal sets the event
+            await self._stop_event.wait()
+            logger.info("Received stop signal")
         except KeyboardInterrupt:
             logger.info("Received interrupt signal")
         finally:
@@ -98,20 +115,30 @@ class ZenonBridgeBot:
             websocket_task.cancel()
     
     async def stop(self):
-        """Stop the bot gracefully."""
+        """Stop the bot gracefully (safe to call more than once or after a failed startup)."""
         self.running = False
+        self._stop_event.set()
+        if self._stopped:
+            return
+        self._stopped = True
         
         logger.info("Stopping bot...")
         
-        # Stop WebSocket
-        if self.websocket:
-            await self.websocket.stop()
-        
-        # Stop Telegram application
-        if self.application:
-            await self.application.updater.stop()
-            await self.application.stop()
-            await self.application.shutdown()
+        try:
+            # Stop WebSocket
+            if self.websocket:
+                await self.websocket.stop()
+            
+            # Stop Telegram application (only the parts that actually started)
+            if self.application:
+                if self.application.updater and self.application.updater.running:
+                    await self.application.updater.stop()
+                if self.application.running:
+                    await self.application.stop()
+                await self.application.shutdown()
+        finally:
+            # Always close the database: its aiosqlite threads would keep the process alive
+            await self.handlers.db.close()
         
         logger.info("Bot stopped")
 
@@ -123,14 +150,25 @@ async def main():
         await bot.initialize()
         await bot.start()
     except Exception as e:
-        logger.error(f"Fatal error: {e}")
+        logger.error("Fatal error: %s", e)
         raise
+    finally:
+        # start() only cleans up once it's running; a startup failure must still release resources
+        await bot.stop()
 
 if __name__ == "__main__":
+    # uvloop's libuv reactor is faster than the default selector loop (not available on Windows)
+    if sys.platform != 'win32':
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            logger.warning("uvloop not installed, using the default asyncio event loop")
+    
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
+        logger.error("Unexpected error: %s", e)
         sys.exit(1)
\ No newline at end of file
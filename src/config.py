@@ -19,6 +19,8 @@ DATABASE_PATH = os.getenv('DATABASE_PATH', './data/bridge_bot.db')
 
 # Logging Configuration
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Write every raw websocket message to the debug log (otherwise only the recent ones on error)
+LOG_RAW_MESSAGES = os.getenv('LOG_RAW_MESSAGES', '0') == '1'
 
 # Transaction Types
 TRANSACTION_TYPES = {
@@ -29,6 +31,13 @@ TRANSACTION_TYPES = {
     'UPDATE_WRAP_REQUEST': 'UpdateWrapRequest'
 }
 
+# Bitmask values for subscriber notification filters
+FILTER_BITS = {
+    'WrapToken': 1,
+    'UnwrapToken': 2,
+    'Redeem': 4
+}
+
 # Token Information
 TOKEN_DECIMALS = {
     'zts1znnxxxxxxxxxxxxx9z4ulx': 8,  # ZNN
@@ -1,154 +1,218 @@
 import json
+import logging
 import random
 import os
-from typing import Dict, List
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Tuple
 from datetime import datetime
 from pathlib import Path
-from src.config import ETHERSCAN_BASE_URL, ZENONHUB_BASE_URL, TRANSACTION_TYPES
+from types import MappingProxyType
+from src.config import ETHERSCAN_BASE_URL, ZENONHUB_BASE_URL, TRANSACTION_TYPES, BRIDGE_ADDRESS
+
+logger = logging.getLogger(__name__)
+
+# Read-only lookup tables shared by every formatter
+TYPE_EMOJIS = MappingProxyType({
+    TRANSACTION_TYPES['WRAP_TOKEN']: '🎁',
+    TRANSACTION_TYPES['UNWRAP_TOKEN']: '📦',
+    TRANSACTION_TYPES['REDEEM']: '💰',
+    TRANSACTION_TYPES['TRANSFER']: '➡️',
+    TRANSACTION_TYPES['UPDATE_WRAP_REQUEST']: '🔄',
+    'Unknown': '❓'
+})
+
+TOKEN_SYMBOLS = MappingProxyType({
+    'zts1znnxxxxxxxxxxxxx9z4ulx': 'ZNN',
+    'zts1qsrxxxxxxxxxxxxxmrhjll': 'QSR'
+})
+
+# Cleaner type labels for the statistics message
+TYPE_LABELS = MappingProxyType({
+    'WrapToken': 'Wraps',
+    'UnwrapToken': 'Unwraps',
+    'Redeem': 'Redeems',
+    'Transfer': 'Transfers'  # In case old data exists
+})
+
+# Transaction types shown in the statistics message, in order
+PRIORITY_TYPES = ('WrapToken', 'UnwrapToken', 'Redeem')
+
+def _shorten(s: str) -> str:
+    """Shorten an address or hash for display."""
+    return s if len(s) <= 16 else f"{s[:10]}...{s[-8:]}"
+
+@lru_cache(maxsize=1024)
+def _zts_address_link(address: str) -> str:
+    """Build the ZenonHub link for a ZTS address (the same addresses recur across notifications)."""
+    return f"[{_shorten(address)}]({ZENONHUB_BASE_URL}/explorer/account/{address})"
+
+@lru_cache(maxsize=8)
+def _cached_load_messages(path: str) -> Tuple[Dict, ...]:
+    """Read and parse a custom messages file once; the tuple is shared by all formatters."""
+    messages_path = Path(path)
+    if not messages_path.exists():
+        logger.warning("Messages file %s not found", messages_path.name)
+        return ()
+    return tuple(json.loads(messages_path.read_bytes()))
 
 class MessageFormatter:
     """Format transaction data into Telegram messages."""
     
+    # Descriptive titles for the notification header
+    _action_texts = {
+        'WrapToken': "Bridge Wrap",
+        'UnwrapToken': "Bridge Unwrap",
+        'Redeem': "Bridge Redeem"
+    }
+    
+    # Notification template; each optional block carries its own leading newline
+    _tpl_transaction = (
+        "{emoji} **{action}**{amount_block}{addr_block}"
+        "{eth_block}\n\n🔍 [{short_hash}]({hash_url}){ts}{custom}"
+    )
+    _tpl_custom = "\n💭 *{message}*\n   — {author}\n"
+    
     def __init__(self):
-        self.type_emojis = {
-            TRANSACTION_TYPES['WRAP_TOKEN']: '🎁',
-            TRANSACTION_TYPES['UNWRAP_TOKEN']: '📦',
-            TRANSACTION_TYPES['REDEEM']: '💰',
-            TRANSACTION_TYPES['TRANSFER']: '➡️',
-            TRANSACTION_TYPES['UPDATE_WRAP_REQUEST']: '🔄',
-            'Unknown': '❓'
-        }
-        
-        self.token_symbols = {
-            'zts1znnxxxxxxxxxxxxx9z4ulx': 'ZNN',
-            'zts1qsrxxxxxxxxxxxxxmrhjll': 'QSR'
-        }
-        
         # Load custom messages
         self.wrap_messages = self._load_messages('wrap_messages.json')
         self.unwrap_messages = self._load_messages('unwrap_messages.json')
+        self._rng = random.Random()
+        
+        # Address layout per transaction type
+        self._address_renderers = {
+            'WrapToken': self._render_to_bridge_addrs,
+            'UnwrapToken': self._render_from_bridge_addrs,
+            'Redeem': self._render_redeem_addrs
+        }
+        
+        # Static command responses are rendered once
+        self._help_text = """
+🤖 **Zenon Bridge Alert Bot**
+
+Monitor Zenon Bridge wrapping and unwrapping activity in real-time!
+
+**Available Commands:**
+/start - Subscribe to bridge notifications
+/stop - Unsubscribe from notifications
+/stats - View bridge statistics
+/status - Check bot connection status
+/filter - Set notification filters
+/help - Show this help message
+
+**Monitored Transaction Types:**
+🎁 WrapToken - Wrapping ZNN/QSR tokens to bridge
+📦 UnwrapToken - Unwrapping tokens from bridge
+💰 Redeem - Redeeming bridged tokens
+
+**Links:**
+[ZenonHub Explorer](https://zenonhub.io)
+[Etherscan](https://etherscan.io)
+"""
+        self._bridge_addr_link = self._format_zts_address(BRIDGE_ADDRESS)
     
-    def _load_messages(self, filename: str) -> List[Dict]:
+    def _load_messages(self, filename: str) -> Tuple[Dict, ...]:
         """Load custom messages from JSON file."""
         try:
             # Get path relative to project root
             project_root = Path(__file__).parent.parent.parent
-            messages_path = project_root / 'messages' / filename
-            
-            if messages_path.exists():
-                with open(messages_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            else:
-                print(f"Warning: Messages file {filename} not found")
-                return []
+            return _cached_load_messages(str(project_root / 'messages' / filename))
         except Exception as e:
-            print(f"Error loading messages from {filename}: {e}")
-            return []
+            logger.error("Error loading messages from %s: %s", filename, e)
+            return ()
     
     def _get_custom_message(self, tx_type: str) -> str:
         """Get a random custom message for the transaction type."""
+        if tx_type == TRANSACTION_TYPES['WRAP_TOKEN']:
+            messages = self.wrap_messages
+        elif tx_type == TRANSACTION_TYPES['UNWRAP_TOKEN']:
+            messages = self.unwrap_messages
+        else:
+            return ""
+        
+        if not messages:
+            return ""
+        
         try:
-            if tx_type == TRANSACTION_TYPES['WRAP_TOKEN'] and self.wrap_messages:
-                message_data = random.choice(self.wrap_messages)
-                return f"\n💭 *{message_data['message']}*\n   — {message_data['author']}\n"
-            elif tx_type == TRANSACTION_TYPES['UNWRAP_TOKEN'] and self.unwrap_messages:
-                message_data = random.choice(self.unwrap_messages)
-                return f"\n💭 *{message_data['message']}*\n   — {message_data['author']}\n"
+            return self._tpl_custom.format_map(messages[self._rng.randrange(len(messages))])
         except Exception as e:
-            print(f"Error getting custom message: {e}")
+            logger.error("Error getting custom message: %s", e)
         
         return ""
     
     def format_transaction(self, tx: Dict) -> str:
         """Format a transaction into a Telegram message."""
-        emoji = self.type_emojis.get(tx.get('type', 'Unknown'), '❓')
         tx_type = tx.get('type', 'Unknown')
+        emoji = TYPE_EMOJIS.get(tx_type, '❓')
         
         # Get token and amount info
         token = tx.get('token', '')
-        token_symbol = self.token_symbols.get(token, token[:8] if token else 'Unknown')
+        token_symbol = TOKEN_SYMBOLS.get(token, token[:8] if token else 'Unknown')
         amount = tx.get('amount', '0')
         formatted_amount = tx.get('formatted_amount', '')
         
-        # Create a more descriptive title based on transaction type
-        if tx_type == 'WrapToken':
-            action_text = "Bridge Wrap"
-        elif tx_type == 'UnwrapToken':
-            action_text = "Bridge Unwrap"
-        elif tx_type == 'Redeem':
-            action_text = "Bridge Redeem"
-        else:
-            action_text = tx_type
-        
-        # Build message with prominent amount display
-        lines = []
-        
-        # Header with transaction type and amount
+        # Header with transaction type and a prominent amount display
         if formatted_amount and amount != '0':
-            lines.extend([
-                f"{emoji} **{action_text}**",
-                f"",
-                f"💎 **{formatted_amount} {token_symbol}**",
-                ""
-            ])
+            amount_block = f"\n\n💎 **{formatted_amount} {token_symbol}**\n"
         else:
-            lines.extend([
-                f"{emoji} **{action_text}**",
-                ""
-            ])
+            amount_block = "\n"
         
-        # Add addresses with better formatting
-        from_addr = tx.get('from_addr', '')
-        to_addr = tx.get('to_addr', '')
-        bridge_addr = 'z1qxemdeddedxdrydgexxxxxxxxxxxxxxxmqgr0d'
-        
-        if tx_type == 'WrapToken':
-            # User wrapping tokens - sending TO bridge
-            lines.append(f"👤 User: {self._format_zts_address(from_addr)}")
-            lines.append(f"🌉 → Bridge")
-        elif tx_type == 'UnwrapToken':
-            # Bridge unwrapping tokens - sending FROM bridge to user
-            lines.append(f"🌉 Bridge →")
-            lines.append(f"👤 User: {self._format_zts_address(to_addr)}")
-        elif tx_type == 'Redeem':
-            # Redeem operation
-            if from_addr == bridge_addr:
-                lines.append(f"🌉 Bridge →")
-                lines.append(f"👤 User: {self._format_zts_address(to_addr)}")
-            else:
-                lines.append(f"👤 User: {self._format_zts_address(from_addr)}")
-                lines.append(f"🌉 → Bridge")
-        else:
-            # Default format for other types
-            if from_addr:
-                lines.append(f"📤 From: {self._format_zts_address(from_addr)}")
-            if to_addr:
-                lines.append(f"📥 To: {self._format_zts_address(to_addr)}")
+        # Address layout for the transaction type
+        render_addrs = self._address_renderers.get(tx_type, self._render_default_addrs)
+        addr_block = render_addrs(tx.get('from_addr', ''), tx.get('to_addr', ''))
         
         # Add ETH address if present (for cross-chain operations)
-        if tx.get('eth_addr'):
-            lines.extend([
-                "",
-                f"🔗 ETH: `{self._short_address(tx['eth_addr'])}`",
-                f"[View on Etherscan]({ETHERSCAN_BASE_URL}/address/{tx['eth_addr']})"
-            ])
-        
-        # Add transaction hash as clickable link
-        lines.extend([
-            "",
-            f"🔍 [{self._short_hash(tx['hash'])}]({ZENONHUB_BASE_URL}/explorer/transaction/{tx['hash']}/data)"
-        ])
+        eth_addr = tx.get('eth_addr')
+        if eth_addr:
+            eth_block = (
+                f"\n\n🔗 ETH: `{_shorten(eth_addr)}`"
+                f"\n[View on Etherscan]({ETHERSCAN_BASE_URL}/address/{eth_addr})"
+            )
+        else:
+            eth_block = ""
         
         # Add timestamp if available
-        if tx.get('timestamp'):
-            lines.append(f"⏱ {tx['timestamp'].strftime('%H:%M:%S UTC')}")
+        timestamp = tx.get('timestamp')
+        ts = f"\n⏱ {timestamp.strftime('%H:%M:%S UTC')}" if timestamp else ""
         
         # Add custom message for wrap/unwrap transactions
         custom_message = self._get_custom_message(tx_type)
-        if custom_message:
-            lines.append(custom_message)
+        custom = f"\n{custom_message}" if custom_message else ""
         
-        return "\n".join(lines)
+        return self._tpl_transaction.format_map({
+            'emoji': emoji,
+            'action': self._action_texts.get(tx_type, tx_type),
+            'amount_block': amount_block,
+            'addr_block': addr_block,
+            'eth_block': eth_block,
+            'short_hash': _shorten(tx['hash']),
+            'hash_url': f"{ZENONHUB_BASE_URL}/explorer/transaction/{tx['hash']}/data",
+            'ts': ts,
+            'custom': custom
+        })
+    
+    def _render_to_bridge_addrs(self, from_addr: str, to_addr: str) -> str:
+        """User sending TO the bridge (wraps)."""
+        return f"\n👤 User: {self._format_zts_address(from_addr)}\n🌉 → Bridge"
+    
+    def _render_from_bridge_addrs(self, from_addr: str, to_addr: str) -> str:
+        """Bridge sending FROM the bridge to a user (unwraps)."""
+        return f"\n🌉 Bridge →\n👤 User: {self._format_zts_address(to_addr)}"
+    
+    def _render_redeem_addrs(self, from_addr: str, to_addr: str) -> str:
+        """Redeems can go either direction."""
+        if from_addr == BRIDGE_ADDRESS:
+            return self._render_from_bridge_addrs(from_addr, to_addr)
+        return self._render_to_bridge_addrs(from_addr, to_addr)
+    
+    def _render_default_addrs(self, from_addr: str, to_addr: str) -> str:
+        """Default format for other types."""
+        addr_block = ""
+        if from_addr:
+            addr_block += f"\n📤 From: {self._format_zts_address(from_addr)}"
+        if to_addr:
+            addr_block += f"\n📥 To: {self._format_zts_address(to_addr)}"
+        return addr_block
     
     def format_stats(self, stats: List[Dict], period_days: int) -> str:
         """Format statistics into a message."""
@@ -158,48 +222,36 @@ class MessageFormatter:
         ]
         
         # Group stats by transaction type
-        stats_by_type = {}
-        total_count = 0
+        stats_by_type = defaultdict(lambda: {'count': 0, 'volume': {}})
         
         for stat in stats:
-            tx_type = stat['type']
-            if tx_type not in stats_by_type:
-                stats_by_type[tx_type] = {'count': 0, 'volume': {}}
-            
-            stats_by_type[tx_type]['count'] += stat['count']
-            total_count += stat['count']
+            data = stats_by_type[stat['type']]
+            data['count'] += stat['count']
             
             if stat['token'] and stat['volume']:
-                token_symbol = self.token_symbols.get(stat['token'], stat['token'][:8])
-                stats_by_type[tx_type]['volume'][token_symbol] = stat['volume']
+                token_symbol = TOKEN_SYMBOLS.get(stat['token'], stat['token'][:8])
+                data['volume'][token_symbol] = stat['volume']
         
-        # Define cleaner type labels
-        type_labels = {
-            'WrapToken': 'Wraps',
-            'UnwrapToken': 'Unwraps', 
-            'Redeem': 'Redeems',
-            'Transfer': 'Transfers'  # In case old data exists
-        }
+        total_count = sum(stat['count'] for stat in stats)
         
         # Show only the transaction types we care about, in order
-        priority_types = ['WrapToken', 'UnwrapToken', 'Redeem']
-        
-        # First show priority types
-        for tx_type in priority_types:
+        has_priority = False
+        for tx_type in PRIORITY_TYPES:
             if tx_type in stats_by_type:
+                has_priority = True
                 data = stats_by_type[tx_type]
-                label = type_labels.get(tx_type, tx_type)
+                label = TYPE_LABELS.get(tx_type, tx_type)
                 lines.append(f"- **{label}**: {data['count']}")
                 
                 # Add volume info if available
                 for token, volume in data['volume'].items():
                     if volume:
-                        lines.append(f"  └─ {volume:,.0f} {token}")
+                        lines.append(f"  └─ {volume:,.2f} {token}")
         
         # If no priority types found, show whatever we have
-        if not any(tx_type in stats_by_type for tx_type in priority_types):
+        if not has_priority:
             for tx_type, data in stats_by_type.items():
-                label = type_labels.get(tx_type, tx_type)
+                label = TYPE_LABELS.get(tx_type, tx_type)
                 lines.append(f"- **{label}**: {data['count']}")
         
         lines.extend([
@@ -211,56 +263,20 @@ class MessageFormatter:
     
     def format_help(self) -> str:
         """Format help message."""
-        return """
-🤖 **Zenon Bridge Alert Bot**
-
-Monitor Zenon Bridge wrapping and unwrapping activity in real-time!
-
-**Available Commands:**
-/start - Subscribe to bridge notifications
-/stop - Unsubscribe from notifications
-/stats - View bridge statistics
-/status - Check bot connection status
-/filter - Set notification filters
-/help - Show this help message
-
-**Monitored Transaction Types:**
-🎁 WrapToken - Wrapping ZNN/QSR tokens to bridge
-📦 UnwrapToken - Unwrapping tokens from bridge
-💰 Redeem - Redeeming bridged tokens
-
-**Links:**
-[ZenonHub Explorer](https://zenonhub.io)
-[Etherscan](https://etherscan.io)
-"""
+        return self._help_text
     
     def format_status(self, is_connected: bool, subscriber_count: int) -> str:
         """Format status message."""
         status = "✅ Connected" if is_connected else "❌ Disconnected"
         
-        bridge_address = 'z1qxemdeddedxdrydgexxxxxxxxxxxxxxxmqgr0d'
-        
         return f"""
 🔌 **Bot Status**
 
 WebSocket: {status}
 Active Subscribers: {subscriber_count}
-Bridge Address: {self._format_zts_address(bridge_address)}
+Bridge Address: {self._bridge_addr_link}
 """
     
-    def _short_address(self, address: str) -> str:
-        """Shorten address for display with new format."""
-        if len(address) > 16:
-            return f"{address[:10]}...{address[-8:]}"
-        return address
-    
     def _format_zts_address(self, address: str, context: str = "") -> str:
         """Format ZTS address as clickable link to ZenonHub."""
-        short_addr = self._short_address(address)
-        return f"[{short_addr}]({ZENONHUB_BASE_URL}/explorer/account/{address})"
-    
-    def _short_hash(self, hash: str) -> str:
-        """Shorten transaction hash for display."""
-        if len(hash) > 16:
-            return f"{hash[:10]}...{hash[-8:]}"
-        return hash
\ No newline at end of file
+        return _zts_address_link(address)
\ No newline at end of file
@@ -1,13 +1,26 @@
+import asyncio
 import logging
+from datetime import timedelta
 from telegram import Update
+from telegram.error import Forbidden, RetryAfter
 from telegram.ext import Application, CommandHandler, ContextTypes
 from typing import Dict
-from database import Database
+from database import Database, filters_to_mask
 from src.telegram.formatter import MessageFormatter
 from src.config import TRANSACTION_TYPES
 
 logger = logging.getLogger(__name__)
 
+# Telegram allows a bot about 30 messages per second across all chats. Each of these
+# send slots is held for at least a second, so sends start at no more than this rate
+MAX_SENDS_PER_SECOND = 30
+
+# Retries for a message Telegram rejected with RetryAfter (flood control)
+MAX_SEND_RETRIES = 3
+
+# Deactivate subscribers after this many consecutive "bot blocked" errors
+MAX_SEND_FAILURES = 3
+
 class TelegramHandlers:
     """Handle Telegram bot commands and messages."""
     
@@ -15,6 +28,8 @@ class TelegramHandlers:
         self.db = Database()
         self.formatter = MessageFormatter()
         self.ws_connected = False
+        self._send_semaphore = asyncio.Semaphore(MAX_SENDS_PER_SECOND)
+        self._send_failures: Dict[int, int] = {}
     
     def set_ws_status(self, connected: bool):
         """Update WebSocket connection status."""
@@ -115,7 +130,7 @@ class TelegramHandlers:
         
         if args[0].lower() == 'all':
             # Clear all filters
-            await self.db.update_subscriber_filters(user_id, [])
+            await self.db.update_subscriber_filters(user_id, 0)
             await update.message.reply_text(
                 "✅ Filters cleared. You will receive all bridge notifications.",
                 parse_mode='Markdown'
@@ -133,7 +148,7 @@ class TelegramHandlers:
                         break
             
             if filters:
-                await self.db.update_subscriber_filters(user_id, filters)
+                await self.db.update_subscriber_filters(user_id, filters_to_mask(filters))
                 filter_list = '\n'.join([f"• {f}" for f in filters])
                 await update.message.reply_text(
                     f"✅ Filters updated. You will only receive notifications for:\n{filter_list}",
@@ -145,30 +160,71 @@ class TelegramHandlers:
                     parse_mode='Markdown'
                 )
     
+    async def _send_message(self, application: Application, chat_id: int, text: str):
+        """Send a single notification, waiting and retrying when Telegram rate limits us."""
+        for attempt in range(MAX_SEND_RETRIES + 1):
+            try:
+                await self._send_rate_limited(application, chat_id, text)
+                return
+            except RetryAfter as e:
+                if attempt == MAX_SEND_RETRIES:
+                    raise
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                logger.warning("Rate limited sending to %s, retrying in %ss", chat_id, delay)
+                await asyncio.sleep(delay)
+    
+    async def _send_rate_limited(self, application: Application, chat_id: int, text: str):
+        """Send one message in a send slot, keeping the slot for at least a second."""
+        loop = asyncio.get_running_loop()
+        async with self._send_semaphore:
+            started = loop.time()
+            try:
+                await application.bot.send_message(
+                    chat_id=chat_id,
+                    text=text,
+                    parse_mode='Markdown',
+                    disable_web_page_preview=True
+                )
+            finally:
+                remaining = started + 1 - loop.time()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+    
     async def send_transaction_notification(self, application: Application, tx_info: Dict):
         """Send transaction notification to all active subscribers."""
-        subscribers = await self.db.get_active_subscribers()
         message = self.formatter.format_transaction(tx_info)
         
         # Store transaction in database
         await self.db.add_transaction(tx_info)
         
-        # Send to each subscriber
-        for subscriber in subscribers:
-            # Check filters
-            filters = subscriber.get('filters', [])
-            if filters and tx_info.get('type') not in filters:
+        # Subscribers whose filters match, from the type index (a zero mask means all types)
+        recipients = self.db.get_subscribers_for_type(tx_info.get('type'))
+        
+        # Send to all matching subscribers concurrently
+        results = await asyncio.gather(
+            *(self._send_message(application, user_id, message) for user_id in recipients),
+            return_exceptions=True
+        )
+        
+        for user_id, result in zip(recipients, results):
+            if not isinstance(result, Exception):
+                self._send_failures.pop(user_id, None)
                 continue
             
-            try:
-                await application.bot.send_message(
-                    chat_id=subscriber['user_id'],
-                    text=message,
-                    parse_mode='Markdown',
-                    disable_web_page_preview=True
-                )
-            except Exception as e:
-                logger.error(f"Failed to send message to {subscriber['user_id']}: {e}")
+            logger.error(f"Failed to send message to {user_id}: {result}")
+            if not isinstance(result, Forbidden):
+                continue
+            
+            # User blocked the bot or deleted their account
+            failures = self._send_failures.get(user_id, 0) + 1
+            if failures >= MAX_SEND_FAILURES:
+                logger.warning(f"Deactivating subscriber {user_id} after {failures} failed sends")
+                await self.db.remove_subscriber(user_id)
+                self._send_failures.pop(user_id, None)
+            else:
+                self._send_failures[user_id] = failures
     
     def register_handlers(self, application: Application):
         """Register all command handlers."""
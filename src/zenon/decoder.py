@@ -2,28 +2,87 @@ import base64
 import struct
 import json
 import logging
+import re
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Optional
 from pathlib import Path
-from src.config import TOKEN_DECIMALS, TRANSACTION_TYPES
+from src.config import BRIDGE_ADDRESS, TOKEN_DECIMALS, TRANSACTION_TYPES
 
 logger = logging.getLogger(__name__)
 
+# pybase64 wraps a SIMD base64 decoder; fall back to the stdlib if it isn't installed
+try:
+    import pybase64
+    _b64decode = pybase64.b64decode
+except ImportError:
+    _b64decode = base64.b64decode
+
+# A 0x-prefixed, 40 hex digit Ethereum address embedded in the call data
+_ETH_RE = re.compile(rb'0x[0-9a-fA-F]{40}')
+
+_METHOD_SIGS = {
+    # Method signatures from actual bridge contract
+    'WRAP_TOKEN': bytes.fromhex('61d224bc'),  # WrapToken method signature
+    # Note: We track unwrap TRANSFERS (bridge->user with amount>0), not REQUESTS (user->bridge with amount=0)
+    # 'UNWRAP_REQUEST': bytes.fromhex('b6069401'),  # UnwrapToken request (we don't track these)
+    'REDEEM': bytes.fromhex('1e83409a'),  # Redeem method
+    'UPDATE_WRAP_REQUEST': bytes.fromhex('d4bb11c0')  # UpdateWrapRequest method (corrected)
+}
+
+# Reverse lookup from the 4-byte selector (as a big-endian int) to the transaction type
+_SELECTOR = struct.Struct('>I')
+_SIG_TO_TYPE = {
+    _SELECTOR.unpack(sig)[0]: TRANSACTION_TYPES.get(method, 'Unknown')
+    for method, sig in _METHOD_SIGS.items()
+}
+
+# ZNN and QSR, the only tokens the bridge wraps and unwraps without call data
+_NATIVE_TOKENS = frozenset(('zts1znnxxxxxxxxxxxxx9z4ulx', 'zts1qsrxxxxxxxxxxxxxmrhjll'))
+
+# Redeem call data is ABI-encoded (hash, log index) and unwrap transfers carry no
+# payload, so neither can contain an ASCII 0x... address worth scanning for
+_NO_ETH_ADDR_TYPES = frozenset((TRANSACTION_TYPES['REDEEM'], TRANSACTION_TYPES['UNWRAP_TOKEN']))
+
+# Smallest-unit divisor per token
+_POW10 = {token: 10 ** decimals for token, decimals in TOKEN_DECIMALS.items()}
+_POW10_DEFAULT = 10 ** 8
+
+@lru_cache(maxsize=4096)
+def _fmt_amount(amount: str, token: str) -> str:
+    """Format a base-unit amount with two decimals (cached: (amount, token) pairs repeat)."""
+    try:
+        amount_int = int(amount)
+    except (TypeError, ValueError):
+        return amount
+    
+    # Integer arithmetic keeps large amounts exact (floats lose precision above 2**53)
+    p = _POW10.get(token, _POW10_DEFAULT)
+    whole, cents = divmod((amount_int * 100 + p // 2) // p, 100)
+    return f"{whole:,}.{cents:02d}"
+
+@lru_cache(maxsize=2048)
+def _ts_from_moment(momentum_timestamp: int) -> Optional[datetime]:
+    """Convert a momentum timestamp to a datetime (cached: blocks in one momentum share it)."""
+    try:
+        return datetime.fromtimestamp(momentum_timestamp)
+    except (OverflowError, OSError, TypeError, ValueError):
+        return None
+
 class TransactionDecoder:
     """Decode Zenon bridge transaction data."""
     
-    def __init__(self):
-        self.method_signatures = {
-            # Method signatures from actual bridge contract
-            'WRAP_TOKEN': bytes.fromhex('61d224bc'),  # WrapToken method signature
-            # Note: We track unwrap TRANSFERS (bridge->user with amount>0), not REQUESTS (user->bridge with amount=0)
-            # 'UNWRAP_REQUEST': bytes.fromhex('b6069401'),  # UnwrapToken request (we don't track these)
-            'REDEEM': bytes.fromhex('1e83409a'),  # Redeem method
-            'UPDATE_WRAP_REQUEST': bytes.fromhex('d4bb11c0')  # UpdateWrapRequest method (corrected)
-        }
-    
     def decode_transaction(self, tx_data: Dict) -> Dict:
         """Decode a transaction and extract relevant information."""
+        # Decode the data field once and share it with the type detection and field extraction
+        raw = tx_data.get('data')
+        data_bytes = None
+        if raw:
+            try:
+                data_bytes = _b64decode(raw)
+            except Exception as e:
+                logger.error("Error decoding data: %s", e)
+        
         result = {
             'hash': tx_data.get('hash'),
             'from_addr': tx_data.get('address'),
@@ -32,18 +91,14 @@ class TransactionDecoder:
             'token': tx_data.get('tokenStandard'),
             'block_height': tx_data.get('height'),
             'timestamp': self._get_timestamp(tx_data),
-            'type': self._determine_tx_type(tx_data),
+            'type': self._determine_tx_type(tx_data, data_bytes),
             'eth_addr': None,
             'raw_data': tx_data.get('data')
         }
         
-        # Decode transaction data if present
-        if tx_data.get('data'):
-            try:
-                decoded_data = self._decode_data(tx_data['data'])
-                result.update(decoded_data)
-            except Exception as e:
-                print(f"Error decoding transaction data: {e}")
+        # Decode transaction data if present (skipped for types that never carry an ASCII ETH address)
+        if data_bytes is not None and result['type'] not in _NO_ETH_ADDR_TYPES:
+            result.update(self._decode_data(data_bytes))
         
         # Format amount with decimals
         if result['amount'] and result['amount'] != '0':
@@ -55,118 +110,79 @@ class TransactionDecoder:
         
         return result
     
-    def _determine_tx_type(self, tx_data: Dict) -> str:
+    def _determine_tx_type(self, tx_data: Dict, data_bytes: Optional[bytes] = None) -> str:
         """Determine transaction type based on method signature and context."""
-        logger.debug(f"Determining transaction type for: {tx_data.get('hash', 'unknown')}")
+        tx_hash = tx_data.get('hash', 'unknown')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Determining transaction type for: %s", tx_hash)
         
-        bridge_addr = 'z1qxemdeddedxdrydgexxxxxxxxxxxxxxxmqgr0d'
+        # First, try the method signature from the decoded data field
+        if data_bytes is not None:
+            logger.debug("Data decoded: %d bytes", len(data_bytes))
+            
+            if len(data_bytes) >= 4:
+                method_sig = _SELECTOR.unpack_from(data_bytes)[0]
+                logger.info("Method signature: 0x%08x", method_sig)
+                
+                # Check against known bridge method signatures
+                tx_type = _SIG_TO_TYPE.get(method_sig)
+                if tx_type:
+                    logger.info("Found matching signature: %s", tx_type)
+                    return tx_type
+                
+                # If has data but no matching signature, it's not a bridge operation
+                logger.debug("Unknown method signature: 0x%08x", method_sig)
+                return 'Unknown'
+        
+        # Read the context fields once for the checks below
         to_addr = tx_data.get('toAddress', '')
         from_addr = tx_data.get('address', '')
-        
-        # First, try to decode method signature from data field
-        if tx_data.get('data') and tx_data['data'] != '':
-            try:
-                data_bytes = base64.b64decode(tx_data['data'])
-                logger.debug(f"Data decoded: {len(data_bytes)} bytes")
-                
-                if len(data_bytes) >= 4:
-                    method_sig = data_bytes[:4]
-                    method_sig_hex = method_sig.hex()
-                    logger.info(f"Method signature: 0x{method_sig_hex}")
-                    
-                    # Check against known bridge method signatures
-                    for method, sig in self.method_signatures.items():
-                        if method_sig == sig:
-                            logger.info(f"Found matching signature: {method}")
-                            return TRANSACTION_TYPES.get(method, 'Unknown')
-                    
-                    # If has data but no matching signature, it's not a bridge operation
-                    logger.debug(f"Unknown method signature: 0x{method_sig_hex}")
-                    return 'Unknown'
-                    
-            except Exception as e:
-                logger.error(f"Error decoding data: {e}")
+        token_std = tx_data.get('tokenStandard', '')
+        amount = tx_data.get('amount', '0')
+        has_amount = amount != '0' and amount != 0
         
         # For transactions TO bridge without explicit method signature
-        if to_addr == bridge_addr:
-            token_std = tx_data.get('tokenStandard', '')
-            amount = tx_data.get('amount', '0')
-            
+        if to_addr == BRIDGE_ADDRESS:
             # If it's sending ZNN/QSR to bridge with amount > 0, likely a wrap
-            if token_std in ['zts1znnxxxxxxxxxxxxx9z4ulx', 'zts1qsrxxxxxxxxxxxxxmrhjll']:
-                if amount != '0' and amount != 0:
-                    logger.info("Identified as WRAP_TOKEN based on context (token to bridge)")
-                    return TRANSACTION_TYPES['WRAP_TOKEN']
+            if token_std in _NATIVE_TOKENS and has_amount:
+                logger.info("Identified as WRAP_TOKEN based on context (token to bridge)")
+                return TRANSACTION_TYPES['WRAP_TOKEN']
         
         # For transactions FROM bridge (these are actual unwrap token transfers, not requests)
-        if from_addr == bridge_addr:
-            token_std = tx_data.get('tokenStandard', '')
-            amount = tx_data.get('amount', '0')
-            
+        if from_addr == BRIDGE_ADDRESS:
             # Check if it's sending ZNN/QSR tokens from bridge to user (unwrap execution)
-            if token_std in ['zts1znnxxxxxxxxxxxxx9z4ulx', 'zts1qsrxxxxxxxxxxxxxmrhjll']:
-                if amount != '0' and amount != 0:
-                    # This is the actual unwrap transfer (bridge sending tokens to user)
-                    logger.info(f"Identified as UNWRAP_TOKEN transfer: {amount} of {token_std}")
-                    return TRANSACTION_TYPES['UNWRAP_TOKEN']
+            if token_std in _NATIVE_TOKENS and has_amount:
+                # This is the actual unwrap transfer (bridge sending tokens to user)
+                logger.info("Identified as UNWRAP_TOKEN transfer: %s of %s", amount, token_std)
+                return TRANSACTION_TYPES['UNWRAP_TOKEN']
         
         # Simple transfers not involving bridge
-        if not tx_data.get('data') or tx_data.get('data') == '':
-            if to_addr != from_addr and to_addr != bridge_addr and from_addr != bridge_addr:
+        if not tx_data.get('data'):
+            if to_addr != from_addr and to_addr != BRIDGE_ADDRESS and from_addr != BRIDGE_ADDRESS:
                 logger.debug("Identified as TRANSFER (not bridge-related)")
                 return TRANSACTION_TYPES['TRANSFER']
         
-        logger.warning(f"Could not determine transaction type for {tx_data.get('hash', 'unknown')}")
+        logger.warning("Could not determine transaction type for %s", tx_hash)
         return 'Unknown'
     
-    def _decode_data(self, data_b64: str) -> Dict:
-        """Decode base64 transaction data."""
-        try:
-            data_bytes = base64.b64decode(data_b64)
-            result = {}
-            
-            # Try to extract ETH address if present
-            # Look for 0x prefix in hex
-            if b'0x' in data_bytes:
-                start = data_bytes.find(b'0x')
-                if start != -1 and len(data_bytes) >= start + 42:
-                    eth_addr = data_bytes[start:start+42].decode('utf-8', errors='ignore')
-                    if self._is_valid_eth_address(eth_addr):
-                        result['eth_addr'] = eth_addr
-            
-            return result
-        except Exception as e:
-            print(f"Error in _decode_data: {e}")
-            return {}
-    
-    def _is_valid_eth_address(self, address: str) -> bool:
-        """Check if string is a valid Ethereum address."""
-        if not address.startswith('0x'):
-            return False
-        if len(address) != 42:
-            return False
-        try:
-            int(address, 16)
-            return True
-        except ValueError:
-            return False
+    def _decode_data(self, data_bytes: bytes) -> Dict:
+        """Extract fields from decoded transaction data."""
+        result = {}
+        
+        # Locate and validate an ETH address in a single regex pass
+        match = _ETH_RE.search(data_bytes)
+        if match:
+            result['eth_addr'] = match.group(0).decode('ascii')
+        
+        return result
     
     def _format_amount(self, amount: str, token: str) -> str:
         """Format amount with proper decimals."""
-        try:
-            decimals = TOKEN_DECIMALS.get(token, 8)
-            amount_int = int(amount)
-            amount_float = amount_int / (10 ** decimals)
-            return f"{amount_float:,.2f}"
-        except:
-            return amount
+        return _fmt_amount(amount, token)
     
     def _get_timestamp(self, tx_data: Dict) -> Optional[datetime]:
         """Extract timestamp from transaction data."""
         confirmation = tx_data.get('confirmationDetail', {})
         if confirmation and confirmation.get('momentumTimestamp'):
-            try:
-                return datetime.fromtimestamp(confirmation['momentumTimestamp'])
-            except:
-                pass
+            return _ts_from_moment(confirmation['momentumTimestamp'])
         return None
\ No newline at end of file
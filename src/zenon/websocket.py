@@ -1,19 +1,75 @@
 import asyncio
+import collections
 import json
+import time
 import websockets
 import logging
 from typing import Callable, Optional
 from datetime import datetime
 from pathlib import Path
-from src.config import ZENON_WSS_URL, BRIDGE_ADDRESS
+from src.config import ZENON_WSS_URL, BRIDGE_ADDRESS, LOG_RAW_MESSAGES
 from src.zenon.decoder import TransactionDecoder
 
 logger = logging.getLogger(__name__)
 
+# orjson parses frames and serializes debug dumps far faster than the stdlib;
+# fall back if it isn't installed. orjson.JSONDecodeError subclasses json.JSONDecodeError.
+try:
+    import orjson
+    _loads = orjson.loads
+    
+    def _dumps_line(obj) -> bytes:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    _loads = json.loads
+    
+    def _dumps_line(obj) -> bytes:
+        return (json.dumps(obj, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+
 # Create logs directory if it doesn't exist
 LOGS_DIR = Path('logs')
 LOGS_DIR.mkdir(exist_ok=True)
 
+# The subscribe request never changes, so it's serialized once (sent as a text frame)
+SUBSCRIBE_FRAME = json.dumps({
+    "jsonrpc": "2.0",
+    "id": 1,
+    "method": "ledger.subscribe",
+    "params": ["allAccountBlocks"]
+})
+
+# Received frames waiting for the message worker; the reader waits when it's full
+MESSAGE_QUEUE_SIZE = 1000
+
+# Debug dumps are queued and appended to hourly NDJSON files by a background task
+LOG_QUEUE_SIZE = 1024
+LOG_BATCH_SIZE = 256
+
+# Recent raw messages kept in memory and written out when processing fails
+RAW_RING_SIZE = 256
+
+# Hashes of recently decoded bridge blocks, so a block seen again (e.g. as a
+# later block's pairedAccountBlock) isn't decoded or notified twice
+SEEN_HASHES_SIZE = 4096
+
+# Blocks sent to the burn address are never bridge operations
+BURN_ADDRESS = 'z1qqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqsggv2f'
+
+# Transaction types worth notifying, and the tokens the bridge moves
+VALID_TYPES = frozenset(('WrapToken', 'UnwrapToken', 'Redeem', 'UpdateWrapRequest'))
+TRANSFER_TYPES = frozenset(('WrapToken', 'UnwrapToken'))
+CONTRACT_CALL_TYPES = frozenset(('UpdateWrapRequest', 'Redeem'))
+VALID_TOKENS = frozenset(('zts1znnxxxxxxxxxxxxx9z4ulx', 'zts1qsrxxxxxxxxxxxxxmrhjll'))
+SYSTEM_TOKEN = 'zts1qqqqqqqqqqqqqqqqtq587y'
+
+def _may_notify(block: dict) -> bool:
+    """Raw-field check run before decoding: can this block pass _is_valid_bridge_transaction?
+    
+    Wraps and unwrap transfers must move ZNN or QSR; every other notified type is a
+    contract call and carries call data. Blocks with neither are skipped undecoded.
+    """
+    return block.get('tokenStandard') in VALID_TOKENS or bool(block.get('data'))
+
 class ZenonWebSocket:
     """Manage WebSocket connection to Zenon node."""
     
@@ -27,15 +83,24 @@ class ZenonWebSocket:
         self.reconnect_delay = 5
         self.max_reconnect_delay = 300
         self._running = False
+        self._message_queue = asyncio.Queue(maxsize=MESSAGE_QUEUE_SIZE)
+        self._worker_task = None
+        self._log_queue = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._log_task = None
+        self._raw_ring = collections.deque(maxlen=RAW_RING_SIZE)
+        self._seen_hashes = set()
+        self._seen_order = collections.deque()
     
     async def start(self):
         """Start the WebSocket connection with auto-reconnect."""
         self._running = True
+        if self._worker_task is None:
+            self._worker_task = asyncio.create_task(self._message_worker())
         while self._running:
             try:
                 await self._connect()
             except Exception as e:
-                logger.error(f"WebSocket error: {e}")
+                logger.error("WebSocket error: %s", e)
                 await asyncio.sleep(self.reconnect_delay)
                 self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
     
@@ -45,46 +110,106 @@ class ZenonWebSocket:
         if self.ws:
             await self._unsubscribe()
             await self.ws.close()
+        if self._worker_task:
+            self._worker_task.cancel()
+            self._worker_task = None
+        if self._log_task:
+            self._log_task.cancel()
+            self._log_task = None
+    
+    def _debug_dump(self, kind: str, obj, force: bool = False):
+        """Queue an object for the debug NDJSON log (no-op unless DEBUG logging is on or forced)."""
+        if not force and not logger.isEnabledFor(logging.DEBUG):
+            return
+        if self._log_task is None:
+            self._log_task = asyncio.create_task(self._log_writer())
+        try:
+            self._log_queue.put_nowait((kind, time.time(), obj))
+        except asyncio.QueueFull:
+            pass  # Drop debug dumps rather than block the websocket
+    
+    async def _log_writer(self):
+        """Drain queued debug dumps and append them to the hourly NDJSON file."""
+        loop = asyncio.get_running_loop()
+        # The current hour's file stays open between batches and is reopened on rotation
+        log_path = None
+        log_file = None
+        try:
+            while True:
+                batch = [await self._log_queue.get()]
+                while len(batch) < LOG_BATCH_SIZE and not self._log_queue.empty():
+                    batch.append(self._log_queue.get_nowait())
+                
+                lines = []
+                for kind, ts, obj in batch:
+                    try:
+                        lines.append(_dumps_line({'kind': kind, 'ts': ts, 'data': obj}))
+                    except (TypeError, ValueError) as e:
+                        logger.error("Failed to serialize %s debug dump: %s", kind, e)
+                
+                path = LOGS_DIR / f"ws_{datetime.now().strftime('%Y%m%d%H')}.ndjson"
+                try:
+                    if path != log_path:
+                        if log_file is not None:
+                            log_file.close()
+                        log_file = None
+                        log_file = await loop.run_in_executor(None, open, path, 'ab')
+                        log_path = path
+                    await loop.run_in_executor(None, self._append_log, log_file, b''.join(lines))
+                except OSError as e:
+                    logger.error("Failed to write debug log %s: %s", path, e)
+                    log_path = None
+        finally:
+            if log_file is not None:
+                log_file.close()
+    
+    @staticmethod
+    def _append_log(log_file, lines: bytes):
+        """Append pre-serialized lines to the open log file in one write."""
+        log_file.write(lines)
+        log_file.flush()
     
     async def _connect(self):
         """Connect to WebSocket and subscribe to bridge address."""
-        logger.info(f"Connecting to {self.url}")
+        logger.info("Connecting to %s", self.url)
         
-        async with websockets.connect(self.url) as ws:
+        # Frames are small JSON blocks; permessage-deflate costs more CPU and memory than it saves
+        async with websockets.connect(self.url, compression=None) as ws:
             self.ws = ws
             self.reconnect_delay = 5  # Reset delay on successful connection
             
             # Subscribe to bridge address
             await self._subscribe()
             
-            # Listen for messages
+            # Listen for messages; parsing and processing happen in the message worker
+            queue = self._message_queue
             async for message in ws:
-                try:
-                    data = json.loads(message)
-                    await self._handle_message(data)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse message: {e}")
-                except Exception as e:
-                    logger.error(f"Error handling message: {e}")
+                await queue.put(message)
+    
+    async def _message_worker(self):
+        """Parse and handle received frames so slow processing never stalls the socket reader."""
+        queue = self._message_queue
+        while True:
+            message = await queue.get()
+            try:
+                data = _loads(message)
+                await self._handle_message(data)
+            except json.JSONDecodeError as e:
+                logger.error("Failed to parse message: %s", e)
+            except Exception as e:
+                logger.error("Error handling message: %s", e)
     
     async def _subscribe(self):
         """Subscribe to all account blocks and filter for bridge transactions."""
-        subscribe_msg = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "ledger.subscribe",
-            "params": ["allAccountBlocks"]
-        }
-        
-        await self.ws.send(json.dumps(subscribe_msg))
+        await self.ws.send(SUBSCRIBE_FRAME)
         
         # Wait for subscription confirmation
         response = await self.ws.recv()
-        data = json.loads(response)
+        data = _loads(response)
         
         if 'result' in data:
             self.subscription_id = data['result']
-            logger.info(f"Subscribed to all account blocks with ID: {self.subscription_id}")
+            logger.info("Subscribed to all account blocks with ID: %s", self.subscription_id)
         else:
             raise Exception(f"Failed to subscribe: {data}")
     
@@ -101,12 +226,10 @@ class ZenonWebSocket:
     
     async def _handle_message(self, data: dict):
         """Handle incoming WebSocket messages."""
-        # Log all raw messages to file for debugging
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # Save raw message to logs
-        with open(LOGS_DIR / f'ws_raw_{timestamp}.json', 'w') as f:
-            json.dump(data, f, indent=2)
+        # Keep recent raw messages for error reports; log them all only when asked to
+        self._raw_ring.append((time.time(), data))
+        if LOG_RAW_MESSAGES:
+            self._debug_dump('ws_raw', data)
         
         # Check if it's a notification
         if data.get('method') == 'ledger.subscription':
@@ -115,89 +238,121 @@ class ZenonWebSocket:
                 # Extract account block data
                 result = params.get('result')
                 if result:
-                    logger.info(f"Received WebSocket notification with {len(result) if isinstance(result, list) else 1} blocks")
+                    logger.info("Received WebSocket notification with %d blocks", len(result) if isinstance(result, list) else 1)
                     await self._process_account_block(result)
             else:
-                logger.warning(f"Received notification for unknown subscription: {params.get('subscription')}")
+                logger.warning("Received notification for unknown subscription: %s", params.get('subscription'))
     
     async def _process_account_block(self, block_data):
         """Process an account block and trigger callback if it's a bridge transaction."""
+        # Valid transactions are collected and dispatched together after the loop
+        pending = []
         try:
-            # Define addresses to filter
-            BURN_ADDRESS = 'z1qqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqsggv2f'
-            
-            # Save block data for debugging
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-            
             # Handle both single blocks and arrays
             blocks = block_data if isinstance(block_data, list) else [block_data]
             
-            for i, block in enumerate(blocks):
+            # Bind attributes used on every block to locals
+            bridge = self.bridge_address
+            decode = self.decoder.decode_transaction
+            is_valid = self._is_valid_bridge_transaction
+            already_seen = self._already_seen
+            
+            for block in blocks:
                 to_addr = block.get('toAddress', '')
                 from_addr = block.get('address', '')
-                block_hash = block.get('hash', 'unknown')
+                direct = to_addr == bridge or from_addr == bridge
+                
+                # Most blocks in the allAccountBlocks stream never touch the bridge:
+                # drop them before any other lookup or logging
+                paired_block = block.get('pairedAccountBlock')
+                if not direct and not (paired_block and (
+                        paired_block.get('address') == bridge or paired_block.get('toAddress') == bridge)):
+                    continue
+                
+                raw_hash = block.get('hash')
+                block_hash = raw_hash or 'unknown'
                 
                 # Log all blocks involving bridge for debugging
-                if to_addr == self.bridge_address or from_addr == self.bridge_address:
-                    logger.info(f"Bridge-related block: hash={block_hash[:16]}, from={from_addr[:20]}, to={to_addr[:20]}")
+                if direct:
+                    logger.info("Bridge-related block: hash=%.16s, from=%.20s, to=%.20s", block_hash, from_addr, to_addr)
                 
                 # Skip burn address transactions
                 if to_addr == BURN_ADDRESS:
-                    logger.debug(f"Skipping burn address transaction: {block_hash[:16]}")
+                    logger.debug("Skipping burn address transaction: %.16s", block_hash)
                     continue
                 
-                # Process transactions FROM bridge (unwrap/redeem)
-                if from_addr == self.bridge_address:
-                    logger.info(f"Found block FROM bridge: {block_hash}")
+                # Decode blocks FROM bridge (unwrap/redeem) or TO bridge (wrap/update) once,
+                # so a bridge self-transaction isn't decoded and notified twice
+                if direct and not _may_notify(block):
+                    logger.debug("Skipping bridge block with no call data or ZNN/QSR: %.16s", block_hash)
+                elif direct and not already_seen(raw_hash):
+                    direction = 'from' if from_addr == bridge else 'to'
+                    logger.info("Found block %s bridge: %s", direction.upper(), block_hash)
                     
                     # Validate it's a real transaction
-                    tx_info = self.decoder.decode_transaction(block)
-                    if self._is_valid_bridge_transaction(tx_info):
-                        logger.info(f"✅ Valid bridge transaction (from bridge): Type={tx_info['type']}, Hash={tx_info['hash'][:16]}, Amount={tx_info.get('amount', 0)}")
-                        
-                        # Save decoded transaction
-                        with open(LOGS_DIR / f'tx_from_bridge_{timestamp}_{i}.json', 'w') as f:
-                            json.dump(tx_info, f, indent=2)
-                        
-                        await self.on_transaction(tx_info)
-                    else:
-                        logger.warning(f"❌ Invalid bridge transaction from bridge: {block_hash[:16]}")
-                
-                # Process transactions TO bridge (wrap/update)
-                if to_addr == self.bridge_address:
-                    logger.info(f"Found block TO bridge: {block_hash}")
-                    
-                    tx_info = self.decoder.decode_transaction(block)
-                    if self._is_valid_bridge_transaction(tx_info):
-                        logger.info(f"✅ Valid bridge transaction (to bridge): Type={tx_info['type']}, Hash={tx_info['hash'][:16]}, Amount={tx_info.get('amount', 0)}")
+                    tx_info = decode(block)
+                    if is_valid(tx_info):
+                        logger.info("✅ Valid bridge transaction (%s bridge): Type=%s, Hash=%.16s, Amount=%s", direction, tx_info['type'], tx_info['hash'], tx_info.get('amount', 0))
                         
                         # Save decoded transaction
-                        with open(LOGS_DIR / f'tx_to_bridge_{timestamp}_{i}.json', 'w') as f:
-                            json.dump(tx_info, f, indent=2)
+                        self._debug_dump(f'tx_{direction}_bridge', tx_info)
                         
-                        await self.on_transaction(tx_info)
+                        pending.append(tx_info)
+                    elif direction == 'from':
+                        logger.warning("❌ Invalid bridge transaction from bridge: %.16s", block_hash)
                     else:
-                        logger.warning(f"❌ Invalid bridge transaction to bridge: {block_hash[:16]}, Type={tx_info.get('type', 'unknown')}")
+                        logger.warning("❌ Invalid bridge transaction to bridge: %.16s, Type=%s", block_hash, tx_info.get('type', 'unknown'))
                 
                 # Also check paired account block if exists
-                paired_block = block.get('pairedAccountBlock')
-                if paired_block and paired_block.get('toAddress') != BURN_ADDRESS:
+                if paired_block:
                     paired_to = paired_block.get('toAddress', '')
                     paired_from = paired_block.get('address', '')
                     
-                    if paired_to == self.bridge_address or paired_from == self.bridge_address:
-                        logger.debug(f"Processing paired block: {paired_block.get('hash', 'unknown')[:16]}")
-                        tx_info = self.decoder.decode_transaction(paired_block)
-                        if self._is_valid_bridge_transaction(tx_info):
-                            logger.info(f"Valid paired bridge transaction: Type={tx_info['type']}, Hash={tx_info['hash']}")
-                            await self.on_transaction(tx_info)
+                    if (paired_to != BURN_ADDRESS and (paired_to == bridge or paired_from == bridge)
+                            and _may_notify(paired_block) and not already_seen(paired_block.get('hash'))):
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("Processing paired block: %.16s", paired_block.get('hash') or 'unknown')
+                        tx_info = decode(paired_block)
+                        if is_valid(tx_info):
+                            logger.info("Valid paired bridge transaction: Type=%s, Hash=%s", tx_info['type'], tx_info['hash'])
+                            pending.append(tx_info)
             
         except Exception as e:
-            logger.error(f"Error processing account block: {e}", exc_info=True)
-            # Save error block for debugging
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            with open(LOGS_DIR / f'ws_error_{timestamp}.json', 'w') as f:
-                json.dump({'error': str(e), 'block_data': block_data}, f, indent=2)
+            logger.error("Error processing account block: %s", e, exc_info=True)
+            # Save error block and the recent raw messages for debugging
+            self._debug_dump('ws_error', {
+                'error': str(e),
+                'block_data': block_data,
+                'recent_messages': list(self._raw_ring)
+            }, force=True)
+        
+        # Blocks decoded before any failure are still notified
+        await self._dispatch_transactions(pending)
+    
+    async def _dispatch_transactions(self, transactions):
+        """Run the transaction callback for a notification's transactions concurrently."""
+        if not transactions:
+            return
+        results = await asyncio.gather(
+            *(self.on_transaction(tx_info) for tx_info in transactions),
+            return_exceptions=True
+        )
+        for tx_info, result in zip(transactions, results):
+            if isinstance(result, Exception):
+                logger.error("Error in transaction callback for %s: %s", tx_info.get('hash'), result)
+    
+    def _already_seen(self, block_hash: Optional[str]) -> bool:
+        """Record a block hash and report whether it was already processed recently."""
+        if not block_hash:
+            return False
+        seen = self._seen_hashes
+        if block_hash in seen:
+            return True
+        seen.add(block_hash)
+        self._seen_order.append(block_hash)
+        if len(self._seen_order) > SEEN_HASHES_SIZE:
+            seen.discard(self._seen_order.popleft())
+        return False
     
     def _is_valid_bridge_transaction(self, tx_info: dict) -> bool:
         """Check if transaction is a valid bridge operation that should be notified.
@@ -208,35 +363,31 @@ class ZenonWebSocket:
         - Redeem: Redemption operations
         - UpdateWrapRequest: Wrap request updates
         """
-        # Valid transaction types for notifications
-        valid_types = ['WrapToken', 'UnwrapToken', 'Redeem', 'UpdateWrapRequest']
-        
         # Check transaction type
-        if tx_info.get('type') not in valid_types:
-            logger.debug(f"Skipping transaction with type: {tx_info.get('type')}")
+        if tx_info.get('type') not in VALID_TYPES:
+            logger.debug("Skipping transaction with type: %s", tx_info.get('type'))
             return False
         
         # Check token is ZNN or QSR
         token = tx_info.get('token', '')
-        valid_tokens = ['zts1znnxxxxxxxxxxxxx9z4ulx', 'zts1qsrxxxxxxxxxxxxxmrhjll']
         
         # For wrap/unwrap transfers, must have valid token and non-zero amount
-        if tx_info['type'] in ['WrapToken', 'UnwrapToken']:
-            if token not in valid_tokens:
-                logger.debug(f"Skipping {tx_info['type']} with invalid token: {token}")
+        if tx_info['type'] in TRANSFER_TYPES:
+            if token not in VALID_TOKENS:
+                logger.debug("Skipping %s with invalid token: %s", tx_info['type'], token)
                 return False
             
             # Must have non-zero amount (we only track actual token transfers, not requests)
             amount = tx_info.get('amount', '0')
             if amount == '0' or amount == 0:
-                logger.debug(f"Skipping {tx_info['type']} with zero amount (likely a request, not transfer)")
+                logger.debug("Skipping %s with zero amount (likely a request, not transfer)", tx_info['type'])
                 return False
         
         # UpdateWrapRequest and Redeem can have zero amounts (they're contract calls)
         # but should still be valid tokens if specified
-        if tx_info['type'] in ['UpdateWrapRequest', 'Redeem']:
-            if token and token not in valid_tokens and token != 'zts1qqqqqqqqqqqqqqqqtq587y':
+        if tx_info['type'] in CONTRACT_CALL_TYPES:
+            if token and token not in VALID_TOKENS and token != SYSTEM_TOKEN:
                 # Allow empty token or system token for these operations
-                logger.debug(f"Allowing {tx_info['type']} with token: {token}")
+                logger.debug("Allowing %s with token: %s", tx_info['type'], token)
         
         return True
\ No newline at end of file